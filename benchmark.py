@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Benchmark the whole upload pipeline offline
+Runs bot.handle_file against fake Pyrogram objects, a mongomock database and a
+loopback libtorrent session. No Telegram credentials or network needed.
+
+    pip install -r requirements-dev.txt
+    python benchmark.py --files 20 --size-mb 50 --concurrency 4
+    python benchmark.py --replay export.ndjson --speedup 60
+    python benchmark.py --files 16 --size-mb 256 --memory-cap 1024   # exits 1 if peak RSS > cap
+    python benchmark.py --compare bench_results/abc1234.json
+
+--replay takes an NDJSON file from /export (or a JSON list of
+{"at": seconds, "size_mb": ..., "user_id": ..., "kind": ...} events).
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import atexit
+import argparse
+import shutil
+import tempfile
+import subprocess
+from types import SimpleNamespace
+from datetime import datetime
+from pathlib import Path
+
+import pymongo
+import mongomock
+
+# bot.py reads its configuration at import time
+DATA_DIR = tempfile.mkdtemp(prefix="torrent_bench_")
+atexit.register(shutil.rmtree, DATA_DIR, ignore_errors=True)
+os.environ.setdefault("API_ID", "1")
+os.environ.setdefault("API_HASH", "benchmark")
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+os.environ.setdefault("BIN_CHANNEL", "-1000000000001")
+os.environ["DATA_DIR"] = DATA_DIR
+
+# Build the libtorrent session on loopback with no DHT, LSD, UPnP or NAT-PMP.
+# TRACKERS stay as in production so magnets and captions have their real
+# length; binding outgoing sockets to loopback keeps announces local
+os.environ["LT_SETTINGS"] = json.dumps({
+    'listen_interfaces': '127.0.0.1:0',
+    'outgoing_interfaces': 'lo',
+    'enable_dht': False,
+    'enable_lsd': False,
+    'enable_upnp': False,
+    'enable_natpmp': False,
+})
+pymongo.MongoClient = mongomock.MongoClient
+
+# The memory cap has to be set before bot.py sizes its budget and libtorrent session
+_cap_parser = argparse.ArgumentParser(add_help=False)
+_cap_parser.add_argument("--memory-cap", type=int, default=0)
+MEMORY_CAP_MB = _cap_parser.parse_known_args()[0].memory_cap
+if MEMORY_CAP_MB:
+    os.environ["MEMORY_BUDGET_MB"] = str(MEMORY_CAP_MB)
+
+import bot  # noqa: E402
+
+STAGES = ("telegram", "download", "hash", "seed", "mongo", "total")
+CHUNK = 1024 * 1024
+SYNTHETIC_BLOCK = os.urandom(CHUNK)
+
+timings = {stage: [] for stage in STAGES}
+
+
+def record(stage: str, started: float):
+    timings[stage].append(time.perf_counter() - started)
+
+
+# --- Fake Pyrogram objects ---
+
+class FakeMessage:
+    """Enough of pyrogram.types.Message for handle_file"""
+
+    next_id = 1
+
+    def __init__(self, client, chat_id: int, user_id: int = 0, media=None,
+                 kind: str = "document"):
+        self.client = client
+        self.id = FakeMessage.next_id
+        FakeMessage.next_id += 1
+        self.chat = SimpleNamespace(id=chat_id)
+        self.from_user = SimpleNamespace(id=user_id, username=f"bench_{user_id}")
+        self.document = media if kind == "document" else None
+        self.video = media if kind == "video" else None
+        self.audio = media if kind == "audio" else None
+
+    async def reply_text(self, text, **kwargs):
+        return await self.client.api_call(FakeMessage(self.client, self.chat.id))
+
+    async def reply_document(self, document, **kwargs):
+        return await self.client.api_call(FakeMessage(self.client, self.chat.id))
+
+    async def edit_text(self, text, **kwargs):
+        return await self.client.api_call(self)
+
+    async def delete(self):
+        return await self.client.api_call(True)
+
+    async def download(self, file_name: str, progress=None):
+        """Write a synthetic payload at the configured download bandwidth"""
+        started = time.perf_counter()
+        media = self.document or self.video or self.audio
+        remaining = media.file_size
+        with open(file_name, "wb") as f:
+            while remaining:
+                size = min(CHUNK, remaining)
+                await asyncio.to_thread(f.write, SYNTHETIC_BLOCK[:size])
+                remaining -= size
+                if self.client.download_bps:
+                    await asyncio.sleep(size / self.client.download_bps)
+        record("download", started)
+        return file_name
+
+
+class FakeClient:
+    """Enough of pyrogram.Client for handle_file, with simulated API latency"""
+
+    def __init__(self, api_latency: float, download_mbps: float):
+        self.api_latency = api_latency
+        self.download_bps = download_mbps * 1024 * 1024
+
+    async def api_call(self, result):
+        await asyncio.sleep(self.api_latency)
+        return result
+
+    async def send_document(self, chat_id, document, **kwargs):
+        return await self.api_call(FakeMessage(self, chat_id))
+
+    send_video = send_document
+    send_audio = send_document
+
+    async def send_message(self, chat_id, text, **kwargs):
+        return await self.api_call(FakeMessage(self, chat_id))
+
+
+def timed(stage: str, func):
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record(stage, started)
+    return wrapper
+
+
+def timed_async(stage: str, func):
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            record(stage, started)
+    return wrapper
+
+
+def instrument_pipeline():
+    """Time the real pipeline functions"""
+    # Telegram time includes rate limiter and FloodWait waits, not just the API call
+    bot.tg_send = timed_async("telegram", bot.tg_send)
+    bot.create_torrent_file = timed("hash", bot.create_torrent_file)
+    bot.start_seeding = timed("seed", bot.start_seeding)
+    bot.save_to_mongodb = timed("mongo", bot.save_to_mongodb)
+
+
+# --- Traffic patterns ---
+
+def synthetic_events(files: int, size_mb: float, rate: float, users: int) -> list[dict]:
+    """`files` uploads of `size_mb`, arriving at `rate` per minute (0 = all at once)"""
+    interval = 60 / rate if rate else 0
+    return [
+        {'at': i * interval, 'size_mb': size_mb, 'user_id': 1000 + i % users, 'kind': 'document'}
+        for i in range(files)
+    ]
+
+
+def load_events(path: Path, speedup: float) -> list[dict]:
+    """Events from a JSON list or an /export NDJSON dump"""
+    text = path.read_text()
+    if text.lstrip().startswith("["):
+        events = json.loads(text)
+    else:
+        records = [json.loads(line) for line in text.splitlines() if line.strip()]
+        start = min(datetime.fromisoformat(r['created_at']) for r in records)
+        events = [
+            {
+                'at': (datetime.fromisoformat(r['created_at']) - start).total_seconds(),
+                'size_mb': r['file_size'] / 1024**2,
+                'user_id': r.get('user_id', 1000),
+                'kind': 'document',
+            }
+            for r in records
+        ]
+    for event in events:
+        event['at'] = event['at'] / speedup
+    return sorted(events, key=lambda e: e['at'])
+
+
+# --- Runner ---
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(values: list[float]) -> dict:
+    return {
+        'count': len(values),
+        'p50': round(percentile(values, 50), 4),
+        'p95': round(percentile(values, 95), 4),
+        'p99': round(percentile(values, 99), 4),
+        'max': round(max(values), 4) if values else 0.0,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run_job(client: FakeClient, index: int, event: dict, semaphore: asyncio.Semaphore):
+    await asyncio.sleep(event['at'])
+    size = int(event['size_mb'] * 1024**2)
+    media = SimpleNamespace(
+        file_id=f"bench_file_{index}",
+        file_unique_id=f"bench_{index:06d}",
+        file_name=f"bench_{index:06d}.bin",
+        file_size=size,
+    )
+    message = FakeMessage(client, event['user_id'], event['user_id'], media, event.get('kind', 'document'))
+
+    async with semaphore:
+        started = time.perf_counter()
+        await bot.handle_file(client, message)
+        record("total", started)
+
+    # Free the disk as we go so long replays fit
+    shutil.rmtree(bot.SEED_DIR / media.file_unique_id, ignore_errors=True)
+
+
+async def sample_memory(stop: asyncio.Event):
+    """Sample stage memory and rebalance the budget as the monitor loop would, faster"""
+    while not stop.is_set():
+        await bot.rebalance_memory_budget()
+        await asyncio.sleep(0.2)
+
+
+async def run(events: list[dict], args) -> dict:
+    client = FakeClient(args.api_latency, args.download_mbps)
+    semaphore = asyncio.Semaphore(args.concurrency or len(events) or 1)
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_memory(stop))
+    monitor = asyncio.create_task(bot.lt_monitor_loop())
+
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        run_job(client, i, event, semaphore) for i, event in enumerate(events)
+    ])
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await sampler
+    monitor.cancel()
+
+    completed = bot.torrents_collection.count_documents({})
+    memory = bot.memory_report()
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.utcnow().isoformat(),
+        'config': {
+            'files': len(events),
+            'completed': completed,
+            'unthrottled': args.unthrottled,
+            'concurrency': args.concurrency,
+            'api_latency': args.api_latency,
+            'download_mbps': args.download_mbps,
+            'memory_cap_mb': args.memory_cap,
+            'replay': str(args.replay) if args.replay else None,
+        },
+        'elapsed_seconds': round(elapsed, 3),
+        'files_per_minute': round(completed / elapsed * 60, 2) if elapsed else 0.0,
+        'stages': {stage: summarize(values) for stage, values in timings.items()},
+        'memory': memory,
+        'memory_cap_exceeded': bool(args.memory_cap) and memory['peak_rss_mb'] > args.memory_cap,
+        'send_queue': bot.send_queue_report(),
+        'torrent_cache': dict(bot.torrent_cache_stats),
+    }
+
+
+def print_results(results: dict):
+    print("\n" + "=" * 50)
+    print("📊 PIPELINE BENCHMARK")
+    print("=" * 50)
+    print(f"🔖 Commit: {results['commit']}")
+    config = results['config']
+    print(f"📄 Files: {config['completed']}/{config['files']} in {results['elapsed_seconds']}s")
+    print(f"⚡ Sustained: {results['files_per_minute']} files/min")
+    print(f"\n{'stage':<10}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for stage, s in results['stages'].items():
+        print(f"{stage:<10}{s['count']:>7}{s['p50']:>10.3f}{s['p95']:>10.3f}{s['p99']:>10.3f}")
+    memory = results['memory']
+    print(f"\n🧠 Budget: {memory['budget_mb']} MB | Peak RSS: {memory['peak_rss_mb']} MB")
+    for stage, data in memory['stages'].items():
+        print(
+            f"   {stage}: peak reserved {data['peak_reserved_mb']} MB, "
+            f"process RSS peak {data['process_rss_peak_mb']} MB over {data['jobs']} jobs"
+        )
+    if results['config']['memory_cap_mb']:
+        verdict = "❌ EXCEEDED" if results['memory_cap_exceeded'] else "✅ within"
+        print(f"   {verdict} {results['config']['memory_cap_mb']} MB cap")
+
+
+def print_comparison(results: dict, baseline: dict):
+    print(f"\n🔍 Compared with {baseline['commit']}")
+    old, new = baseline['files_per_minute'], results['files_per_minute']
+    print(f"   files/min: {old} → {new} ({(new - old) / old * 100 if old else 0:+.1f}%)")
+    for stage, s in results['stages'].items():
+        before = baseline['stages'].get(stage, {}).get('p95', 0)
+        change = (s['p95'] - before) / before * 100 if before else 0
+        print(f"   {stage} p95: {before:.3f}s → {s['p95']:.3f}s ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline upload pipeline benchmark")
+    parser.add_argument("--files", type=int, default=10, help="Synthetic uploads to run")
+    parser.add_argument("--size-mb", type=float, default=20, help="Synthetic file size")
+    parser.add_argument("--rate", type=float, default=0, help="Uploads per minute (0 = burst)")
+    parser.add_argument("--users", type=int, default=4, help="Distinct synthetic users/chats")
+    parser.add_argument("--concurrency", type=int, default=0, help="Max parallel jobs (0 = unlimited)")
+    parser.add_argument("--replay", type=Path, help="Replay an /export NDJSON or JSON event list")
+    parser.add_argument("--speedup", type=float, default=1.0, help="Replay time compression")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="Seconds per fake API call")
+    parser.add_argument("--download-mbps", type=float, default=0, help="Fake download speed (0 = disk speed)")
+    parser.add_argument("--unthrottled", action="store_true", help="Lift the Telegram rate limits")
+    parser.add_argument("--memory-cap", type=int, default=0, help="Memory budget in MB; fail if peak RSS exceeds it")
+    parser.add_argument("--output", type=Path, help="Results JSON (default bench_results/<commit>.json)")
+    parser.add_argument("--compare", type=Path, help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    if args.unthrottled:
+        bot.TG_CHAT_RATE = bot.TG_GROUP_RATE = bot.TG_GLOBAL_RATE = 1e6
+        bot.global_bucket = bot.new_bucket(1e6, 1e6)
+    instrument_pipeline()
+
+    if args.replay:
+        events = load_events(args.replay, args.speedup)
+    else:
+        events = synthetic_events(args.files, args.size_mb, args.rate, args.users)
+    if not events:
+        sys.exit("No events to run")
+
+    results = asyncio.run(run(events, args))
+    print_results(results)
+
+    output = args.output or Path("bench_results") / f"{results['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2, default=str))
+    print(f"\n💾 Saved: {output}")
+
+    if args.compare:
+        print_comparison(results, json.loads(args.compare.read_text()))
+
+    if results['memory_cap_exceeded']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
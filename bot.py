@@ -6,9 +6,19 @@ from pyrogram import Client, filters
 from pyrogram.types import Message
 from pyrogram.errors import FloodWait
 from pymongo import MongoClient
+from bson import ObjectId
+from bson.errors import InvalidId
 from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+import json
+import zipfile
+import hashlib
 import time
 import logging
+import resource
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 
 # Setup logging
 logging.basicConfig(
@@ -28,13 +38,54 @@ BIN_CHANNEL = int(os.getenv("BIN_CHANNEL"))
 OWNER_ID = int(os.getenv("OWNER_ID", "0"))
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://mongodb:27017/")
 
+# Local bulk export endpoint (EXPORT_PORT=0 disables it)
+EXPORT_HOST = os.getenv("EXPORT_HOST", "127.0.0.1")
+EXPORT_PORT = int(os.getenv("EXPORT_PORT", "8080"))
+EXPORT_BATCH_SIZE = 500  # Records fetched from MongoDB per page
+
+# Outbound Telegram rate limits (messages per second)
+TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", "25"))
+TG_CHAT_RATE = float(os.getenv("TG_CHAT_RATE", "1"))
+TG_GROUP_RATE = float(os.getenv("TG_GROUP_RATE", str(20 / 60)))  # Groups and channels
+TG_MAX_RETRIES = 5
+CAPTION_LIMIT = 1024
+
+# Background piece scrubber (SCRUB_RATE_MB=0 disables it)
+SCRUB_RATE_MB = int(os.getenv("SCRUB_RATE_MB", "20"))  # Read budget per second
+SCRUB_INTERVAL_HOURS = float(os.getenv("SCRUB_INTERVAL_HOURS", "24"))
+
+# In-memory torrent metadata cache, bounded by bencoded size
+TORRENT_CACHE_MB = int(os.getenv("TORRENT_CACHE_MB", "64"))
+
+# libtorrent setting overrides as JSON, applied when the session is built
+# (e.g. '{"listen_interfaces": "127.0.0.1:0", "enable_dht": false}')
+LT_SETTINGS = json.loads(os.getenv("LT_SETTINGS", "{}"))
+
 # Directories
-SEED_DIR = Path("/srv/seeds")
-TORRENT_DIR = Path("/srv/torrents")
+DATA_DIR = Path(os.getenv("DATA_DIR", "/srv"))
+SEED_DIR = DATA_DIR / "seeds"
+TORRENT_DIR = DATA_DIR / "torrents"
+EXPORT_DIR = DATA_DIR / "exports"
+QUARANTINE_DIR = DATA_DIR / "quarantine"
 
 # Create directories
 SEED_DIR.mkdir(parents=True, exist_ok=True)
 TORRENT_DIR.mkdir(parents=True, exist_ok=True)
+EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+QUARANTINE_DIR.mkdir(parents=True, exist_ok=True)
+
+# Memory budget (MB). 0 = derive from the container's cgroup limit
+MEMORY_BUDGET_MB = int(os.getenv("MEMORY_BUDGET_MB", "0"))
+DOWNLOAD_JOB_MB = int(os.getenv("DOWNLOAD_JOB_MB", "64"))  # Reserved per concurrent download
+HASH_JOB_MB = int(os.getenv("HASH_JOB_MB", "128"))  # Reserved per concurrent hashing job
+
+# How the budget is split between libtorrent (cache, send buffers, disk queue),
+# hashing and downloads
+MEMORY_SHARES = {
+    'libtorrent': 0.10,
+    'hash': 0.45,
+    'download': 0.45,
+}
 
 # ULTRA FAST trackers
 TRACKERS = [
@@ -65,12 +116,240 @@ TRACKERS = [
     "wss://tracker.fastcast.nz"
 ]
 
+# --- Memory Budget ---
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+LT_BLOCK_SIZE = 16 * 1024  # libtorrent cache settings are counted in 16 KiB blocks
+LT_MAX_CACHE_BLOCKS = 2048  # 32 MiB, the previous fixed cache_size / checking_mem_usage
+LT_UNCHOKE_SLOTS = 200  # Peers we upload to at once, each holding a send buffer
+
+
+def read_cgroup_value(v2_name: str, v1_name: str) -> str | None:
+    """Read a cgroup memory file (v2 first, then v1)"""
+    for path in (CGROUP_ROOT / v2_name, CGROUP_ROOT / "memory" / v1_name):
+        try:
+            return path.read_text().strip()
+        except OSError:
+            continue
+    return None
+
+
+def cgroup_memory_limit() -> int | None:
+    """Container memory limit in bytes, or None if unlimited"""
+    value = read_cgroup_value("memory.max", "memory.limit_in_bytes")
+    if not value or value == "max":
+        return None
+    limit = int(value)
+    # cgroup v1 reports "unlimited" as a huge page-aligned number
+    if limit >= 1 << 60:
+        return None
+    return limit
+
+
+def cgroup_memory_usage() -> int | None:
+    """Container working set in bytes (usage minus reclaimable inactive file cache)"""
+    value = read_cgroup_value("memory.current", "memory.usage_in_bytes")
+    if not value:
+        return None
+    usage = int(value)
+    
+    # Seeding from mmap'd files fills the page cache up to the limit, so raw
+    # usage always looks full; kubelet and docker subtract inactive_file too
+    stat = read_cgroup_value("memory.stat", "memory.stat") or ""
+    for line in stat.splitlines():
+        key, _, amount = line.partition(" ")
+        if key in ("inactive_file", "total_inactive_file"):
+            return max(usage - int(amount), 0)
+    return usage
+
+
+def cgroup_memory_pressure() -> float:
+    """PSI 'some avg10' memory pressure (percent), 0 when unavailable"""
+    value = read_cgroup_value("memory.pressure", "memory.pressure")
+    if not value:
+        return 0.0
+    for line in value.splitlines():
+        if line.startswith("some"):
+            for field in line.split():
+                if field.startswith("avg10="):
+                    return float(field.split("=", 1)[1])
+    return 0.0
+
+
+def total_memory_budget() -> int:
+    """Global memory budget in bytes"""
+    if MEMORY_BUDGET_MB > 0:
+        return MEMORY_BUDGET_MB * 1024 * 1024
+    limit = cgroup_memory_limit()
+    if limit is None:
+        limit = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    # Leave headroom for Python, Pyrogram and MongoDB client buffers
+    return int(limit * 0.75)
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0
+
+
+def peak_rss() -> int:
+    """Peak resident set size of this process in bytes"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def pressure_factor() -> float:
+    """Shrink factor for the budget based on cgroup memory pressure"""
+    pressure = cgroup_memory_pressure()
+    limit = cgroup_memory_limit()
+    usage = cgroup_memory_usage()
+    usage_ratio = usage / limit if limit and usage else 0.0
+    
+    if pressure > 10 or usage_ratio > 0.90:
+        return 0.5
+    if pressure > 5 or usage_ratio > 0.80:
+        return 0.75
+    return 1.0
+
+
+def split_memory_budget(factor: float = 1.0) -> dict:
+    """Divide the global budget between libtorrent, hashing and downloads"""
+    total = total_memory_budget() * factor
+    return {stage: int(total * share) for stage, share in MEMORY_SHARES.items()}
+
+
+def libtorrent_memory_settings(share_bytes: int) -> dict:
+    """libtorrent buffer settings sized from its share of the budget"""
+    # Half the share for peer send buffers, spread over the unchoked peers
+    watermark = min(max(share_bytes // 2 // LT_UNCHOKE_SLOTS, 128 * 1024), 5 * 1024 * 1024)
+    # cache_size only applies to libtorrent 1.x; 2.x reads through mmap
+    blocks = min(max(share_bytes // 8 // LT_BLOCK_SIZE, 256), LT_MAX_CACHE_BLOCKS)
+    return {
+        'send_buffer_watermark': watermark,
+        'send_buffer_low_watermark': watermark // 5,
+        'max_queued_disk_bytes': min(max(share_bytes // 16, 1024 * 1024), 16 * 1024 * 1024),
+        'cache_size': blocks,
+        'checking_mem_usage': max(blocks // 4, 256),
+    }
+
+
+# Current per-stage limits and reservations (bytes)
+memory_limits = split_memory_budget()
+memory_reserved = {'hash': 0, 'download': 0}
+memory_factor = 1.0
+memory_condition = None
+
+# Per-stage accounting (bytes): peak budget reserved by the stage, and peak
+# process RSS observed while the stage had work in flight
+stage_memory = {
+    stage: {'jobs': 0, 'active': 0, 'peak_reserved': 0, 'process_rss_peak': 0}
+    for stage in memory_reserved
+}
+
+
+def sample_stage_memory():
+    """Record the current process RSS against every stage that has work in flight"""
+    rss = current_rss()
+    for data in stage_memory.values():
+        if data['active']:
+            data['process_rss_peak'] = max(data['process_rss_peak'], rss)
+
+
+@asynccontextmanager
+async def memory_reservation(stage: str, nbytes: int):
+    """Wait until `nbytes` of the stage budget is free, hold it for the block"""
+    global memory_condition
+    if memory_condition is None:
+        memory_condition = asyncio.Condition()
+    
+    # A single job larger than the whole stage budget still runs, alone
+    async with memory_condition:
+        await memory_condition.wait_for(
+            lambda: memory_reserved[stage] == 0
+            or memory_reserved[stage] + nbytes <= memory_limits[stage]
+        )
+        memory_reserved[stage] += nbytes
+    
+    stage_memory[stage]['peak_reserved'] = max(
+        stage_memory[stage]['peak_reserved'], memory_reserved[stage]
+    )
+    stage_memory[stage]['active'] += 1
+    sample_stage_memory()
+    try:
+        yield
+    finally:
+        sample_stage_memory()
+        stage_memory[stage]['active'] -= 1
+        stage_memory[stage]['jobs'] += 1
+        async with memory_condition:
+            memory_reserved[stage] -= nbytes
+            memory_condition.notify_all()
+
+
+async def rebalance_memory_budget():
+    """Re-split the budget under the current cgroup pressure"""
+    global memory_limits, memory_factor
+    factor = pressure_factor()
+    sample_stage_memory()
+    if factor == memory_factor:
+        return
+    
+    memory_factor = factor
+    memory_limits = split_memory_budget(factor)
+    lt_session.apply_settings(libtorrent_memory_settings(memory_limits['libtorrent']))
+    logger.info(
+        f"🧠 Memory budget rebalanced x{factor} | "
+        f"libtorrent: {memory_limits['libtorrent'] // 1024**2}MB | "
+        f"Hash: {memory_limits['hash'] // 1024**2}MB | "
+        f"Download: {memory_limits['download'] // 1024**2}MB"
+    )
+    if memory_condition is not None:
+        async with memory_condition:
+            memory_condition.notify_all()
+
+
+def memory_report() -> dict:
+    """Snapshot of budget, reservations and per-stage accounting (MB)"""
+    mb = 1024**2
+    return {
+        'budget_mb': total_memory_budget() // mb,
+        'factor': memory_factor,
+        'pressure': cgroup_memory_pressure(),
+        'rss_mb': current_rss() // mb,
+        'peak_rss_mb': peak_rss() // mb,
+        'limits_mb': {k: v // mb for k, v in memory_limits.items()},
+        'reserved_mb': {k: v // mb for k, v in memory_reserved.items()},
+        'stages': {
+            stage: {
+                'jobs': data['jobs'],
+                'active': data['active'],
+                'reserved_mb': memory_reserved[stage] // mb,
+                'peak_reserved_mb': data['peak_reserved'] // mb,
+                'process_rss_peak_mb': data['process_rss_peak'] // mb,
+            }
+            for stage, data in stage_memory.items()
+        },
+    }
+
+
 # Initialize MongoDB
 mongo_client = MongoClient(MONGO_URI)
 db = mongo_client['torrent_bot']
 torrents_collection = db['torrents']
 stats_collection = db['stats']
 
+# Indexes for cursor-based export pagination and info_hash lookups
+try:
+    torrents_collection.create_index([("created_at", 1), ("_id", 1)])
+    torrents_collection.create_index([("user_id", 1), ("created_at", 1), ("_id", 1)])
+    # Scrubber lookups and status updates
+    torrents_collection.create_index("info_hash")
+except Exception as e:
+    logger.warning(f"⚠️ MongoDB index creation skipped: {e}")
+
 logger.info("MongoDB connected successfully")
 
 # Initialize Bot
@@ -79,7 +358,7 @@ app = Client(
     api_id=API_ID,
     api_hash=API_HASH,
     bot_token=BOT_TOKEN,
-    workdir="/srv",
+    workdir=str(DATA_DIR),
     workers=8 
 )
 
@@ -91,7 +370,8 @@ lt_session = lt.session({
     'announce_to_all_tiers': True,
     'announce_to_all_trackers': True,
     'aio_threads': 16,  
-    'checking_mem_usage': 2048  # 2GB
+    'checking_mem_usage': libtorrent_memory_settings(memory_limits['libtorrent'])['checking_mem_usage'],
+    **LT_SETTINGS
 })
 
 # ULTRA FAST seeding settings
@@ -108,7 +388,7 @@ settings = {
     'active_limit': -1,
     'max_out_request_queue': 5000,
     'max_allowed_in_request_queue': 5000,
-    'unchoke_slots_limit': 200, 
+    'unchoke_slots_limit': LT_UNCHOKE_SLOTS, 
     'max_peerlist_size': 8000,
     'max_paused_peerlist_size': 8000,
     'min_reconnect_time': 1,
@@ -119,7 +399,6 @@ settings = {
     'seeding_outgoing_connections': True,
     'no_connect_privileged_ports': False,
     'seed_choking_algorithm': 1,  # Fastest upload
-    'cache_size': 2048,  # 2GB cache
     'use_read_cache': True,
     'cache_buffer_chunk_size': 128,
     'read_cache_line_size': 128,
@@ -128,21 +407,28 @@ settings = {
     'max_retry_port_bind': 100,
     'alert_queue_size': 2000,
     'allow_multiple_connections_per_ip': True,
-    'send_buffer_watermark': 5 * 1024 * 1024,
-    'send_buffer_low_watermark': 1 * 1024 * 1024,
     'send_buffer_watermark_factor': 150,
+    # Cache, send buffers and disk queue sized from the memory budget
+    **libtorrent_memory_settings(memory_limits['libtorrent']),
+    **LT_SETTINGS
 }
 lt_session.apply_settings(settings)
 
 # Add DHT routers for better peer discovery
-lt_session.add_dht_router("router.bittorrent.com", 6881)
-lt_session.add_dht_router("dht.transmissionbt.com", 6881)
-lt_session.add_dht_router("router.utorrent.com", 6881)
-lt_session.add_dht_router("dht.libtorrent.org", 25401)
+if settings['enable_dht']:
+    lt_session.add_dht_router("router.bittorrent.com", 6881)
+    lt_session.add_dht_router("dht.transmissionbt.com", 6881)
+    lt_session.add_dht_router("router.utorrent.com", 6881)
+    lt_session.add_dht_router("dht.libtorrent.org", 25401)
 
 # Store active torrents
 active_torrents = {}
 
+# Parsed torrent metadata by info_hash (LRU, oldest first)
+torrent_info_cache = OrderedDict()
+torrent_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'bytes': 0}
+torrent_cache_lock = threading.Lock()  # Filled from executor threads
+
 logger.info("Bot initialized with optimized settings")
 
 
@@ -155,7 +441,59 @@ def save_to_mongodb(torrent_data: dict):
         logger.error(f"MongoDB save error: {e}")
 
 
-def create_torrent_file(file_path: Path) -> tuple[Path, str]:
+def cache_torrent_data(torrent_data: bytes) -> dict:
+    """Parse bencoded torrent bytes once and cache the metadata, returns the cache entry"""
+    info = lt.torrent_info(lt.bdecode(torrent_data))
+    info_hash = str(info.info_hash())
+    
+    with torrent_cache_lock:
+        if info_hash in torrent_info_cache:
+            torrent_cache_stats['bytes'] -= torrent_info_cache.pop(info_hash)['size']
+    
+        entry = {
+            'info_hash': info_hash,
+            'info': info,
+            'magnet': lt.make_magnet_uri(info),
+            'size': len(torrent_data),
+        }
+        torrent_info_cache[info_hash] = entry
+        torrent_cache_stats['bytes'] += len(torrent_data)
+    
+        # Evict least recently used entries over the size bound
+        limit = TORRENT_CACHE_MB * 1024 * 1024
+        while torrent_cache_stats['bytes'] > limit and len(torrent_info_cache) > 1:
+            _, evicted = torrent_info_cache.popitem(last=False)
+            torrent_cache_stats['bytes'] -= evicted['size']
+            torrent_cache_stats['evictions'] += 1
+    
+    return entry
+
+
+def get_torrent_metadata(info_hash: str, torrent_file: Path | None = None) -> dict | None:
+    """Cached metadata for info_hash, loaded from `torrent_file` on a miss"""
+    with torrent_cache_lock:
+        entry = torrent_info_cache.get(info_hash)
+        if entry is not None:
+            torrent_info_cache.move_to_end(info_hash)
+            torrent_cache_stats['hits'] += 1
+            return entry
+        torrent_cache_stats['misses'] += 1
+    
+    if torrent_file is None or not torrent_file.exists():
+        return None
+    
+    entry = cache_torrent_data(torrent_file.read_bytes())
+    if entry['info_hash'] != info_hash:
+        # The .torrent was overwritten by another upload with the same name
+        logger.warning(
+            f"⚠️ {torrent_file.name} holds {entry['info_hash'][:16]}, "
+            f"expected {info_hash[:16]}"
+        )
+        return None
+    return entry
+
+
+def create_torrent_file(file_path: Path) -> tuple[Path, str, str]:
     """Create .torrent file and magnet link - ULTRA OPTIMIZED for YTS-style speed"""
     try:
         fs = lt.file_storage()
@@ -188,19 +526,21 @@ def create_torrent_file(file_path: Path) -> tuple[Path, str]:
         # Generate piece hashes
         lt.set_piece_hashes(t, str(file_path.parent))
         
-        # Generate torrent
+        # Generate torrent, parse once from memory and generate magnet link
         torrent_data = lt.bencode(t.generate())
-        torrent_file_path = TORRENT_DIR / f"{file_path.stem}.torrent"
+        metadata = cache_torrent_data(torrent_data)
+        info_hash = metadata['info_hash']
+        magnet_link = metadata['magnet']
+        
+        # One directory per info_hash so same-name uploads don't overwrite each other
+        torrent_file_path = TORRENT_DIR / info_hash / f"{file_path.stem}.torrent"
+        torrent_file_path.parent.mkdir(parents=True, exist_ok=True)
         
         with open(torrent_file_path, "wb") as f:
             f.write(torrent_data)
         
-        # Generate magnet link
-        info = lt.torrent_info(str(torrent_file_path))
-        magnet_link = lt.make_magnet_uri(info)
-        
         logger.info(f"Torrent created: {torrent_file_path.name} | Piece: {piece_size/1024}KB")
-        return torrent_file_path, magnet_link
+        return torrent_file_path, magnet_link, info_hash
         
     except Exception as e:
         logger.error(f"Error creating torrent: {e}")
@@ -215,14 +555,20 @@ def apply_aggressive_handle_settings(handle: lt.torrent_handle):
         handle.set_upload_limit(-1)  # No upload limit
         
         # Force immediate announces to ALL trackers
-        handle.force_reannounce(0, -1)  # All trackers
+        handle.force_reannounce()  # All trackers, immediately
         handle.force_dht_announce()
 
 
-def start_seeding(file_path: Path, torrent_file: Path) -> str:
+def start_seeding(file_path: Path, torrent_file: Path, info_hash: str | None = None) -> str:
     """Start seeding with ULTRA FAST settings (YTS-style)"""
     try:
-        info = lt.torrent_info(str(torrent_file))
+        if info_hash:
+            metadata = get_torrent_metadata(info_hash, torrent_file)
+            if metadata is None:
+                raise ValueError(f"No metadata for {info_hash[:16]} in {torrent_file.name}")
+        else:
+            metadata = cache_torrent_data(torrent_file.read_bytes())
+        info = metadata['info']
         
         # Create add_torrent_params with MAXIMUM performance
         atp = lt.add_torrent_params()
@@ -267,6 +613,9 @@ async def lt_monitor_loop():
         # Process alerts
         lt_session.pop_alerts(lt.session.alert_mask) 
         
+        # Keep the memory budget in line with cgroup pressure
+        await rebalance_memory_budget()
+        
         # Re-apply aggressive settings to all handles
         for info_hash, data in list(active_torrents.items()):
             handle = data['handle']
@@ -275,6 +624,557 @@ async def lt_monitor_loop():
                 
         await asyncio.sleep(15) # Check frequently
 
+# --- Telegram Send Scheduler ---
+
+def new_bucket(rate: float, capacity: float) -> dict:
+    return {'rate': rate, 'capacity': capacity, 'tokens': capacity, 'updated': time.monotonic()}
+
+
+# Token buckets: one global, one per chat
+global_bucket = new_bucket(TG_GLOBAL_RATE, TG_GLOBAL_RATE)
+chat_buckets = {}
+
+# FloodWait deadlines (monotonic time) per chat, plus a global one
+flood_until = {}
+global_flood_until = 0.0
+
+# Queue metrics
+send_queue_depth = {}
+send_stats = {'sent': 0, 'queued': 0, 'max_queued': 0, 'flood_waits': 0, 'flood_wait_seconds': 0}
+
+
+def chat_bucket(chat_id: int) -> dict:
+    if chat_id not in chat_buckets:
+        # Negative IDs are groups and channels, which Telegram limits harder
+        rate = TG_GROUP_RATE if chat_id < 0 else TG_CHAT_RATE
+        chat_buckets[chat_id] = new_bucket(rate, 3)
+    return chat_buckets[chat_id]
+
+
+def bucket_wait(bucket: dict, now: float) -> float:
+    """Refill `bucket` and return seconds until one token is available"""
+    bucket['tokens'] = min(
+        bucket['capacity'],
+        bucket['tokens'] + (now - bucket['updated']) * bucket['rate']
+    )
+    bucket['updated'] = now
+    if bucket['tokens'] >= 1:
+        return 0.0
+    return (1 - bucket['tokens']) / bucket['rate']
+
+
+async def acquire_send_slot(chat_id: int):
+    """Wait for a free slot in the global and per-chat buckets"""
+    bucket = chat_bucket(chat_id)
+    while True:
+        now = time.monotonic()
+        wait = max(flood_until.get(chat_id, 0.0), global_flood_until) - now
+        if wait <= 0:
+            wait = max(bucket_wait(global_bucket, now), bucket_wait(bucket, now))
+            if wait <= 0:
+                global_bucket['tokens'] -= 1
+                bucket['tokens'] -= 1
+                return
+        await asyncio.sleep(wait)
+
+
+async def tg_send(chat_id: int, method, *args, **kwargs):
+    """Run a Telegram API call through the rate limiter, retrying on FloodWait"""
+    global global_flood_until
+    send_queue_depth[chat_id] = send_queue_depth.get(chat_id, 0) + 1
+    send_stats['queued'] += 1
+    send_stats['max_queued'] = max(send_stats['max_queued'], sum(send_queue_depth.values()))
+    try:
+        for attempt in range(TG_MAX_RETRIES):
+            await acquire_send_slot(chat_id)
+            try:
+                result = await method(*args, **kwargs)
+                send_stats['sent'] += 1
+                return result
+            except FloodWait as e:
+                send_stats['flood_waits'] += 1
+                send_stats['flood_wait_seconds'] += e.value
+                logger.warning(f"⏳ FloodWait {e.value}s on {chat_id} (attempt {attempt + 1})")
+                # Hold back this chat, and briefly everything else, until Telegram allows it
+                flood_until[chat_id] = time.monotonic() + e.value
+                global_flood_until = max(global_flood_until, time.monotonic() + min(e.value, 5))
+        raise RuntimeError(f"Gave up after {TG_MAX_RETRIES} FloodWaits on {chat_id}")
+    finally:
+        send_queue_depth[chat_id] -= 1
+        if not send_queue_depth[chat_id]:
+            del send_queue_depth[chat_id]
+        send_stats['queued'] -= 1
+
+
+def send_queue_report() -> dict:
+    """Snapshot of outbound queue depth and FloodWait counters"""
+    now = time.monotonic()
+    return {
+        **send_stats,
+        'chats_waiting': len(send_queue_depth),
+        'chats_in_flood_wait': sum(1 for until in flood_until.values() if until > now),
+        'global_tokens': round(global_bucket['tokens'], 1),
+    }
+
+
+# --- Bulk Export ---
+
+class ZipChunkWriter:
+    """Unseekable file object that hands zip output back in chunks"""
+    
+    def __init__(self):
+        self.chunks = []
+    
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def build_export_query(user_id: int | None = None, since: datetime | None = None,
+                       until: datetime | None = None, min_size: int | None = None,
+                       max_size: int | None = None) -> dict:
+    """MongoDB filter for an export range"""
+    query = {}
+    if user_id is not None:
+        query['user_id'] = user_id
+    if since or until:
+        query['created_at'] = {}
+        if since:
+            query['created_at']['$gte'] = since
+        if until:
+            query['created_at']['$lt'] = until
+    if min_size is not None or max_size is not None:
+        query['file_size'] = {}
+        if min_size is not None:
+            query['file_size']['$gte'] = min_size
+        if max_size is not None:
+            query['file_size']['$lte'] = max_size
+    return query
+
+
+def encode_cursor(doc: dict) -> str:
+    """Opaque resume position after `doc`"""
+    return f"{doc['created_at'].isoformat()}|{doc['_id']}"
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, ObjectId]:
+    created_at, _, _id = cursor.partition("|")
+    try:
+        return datetime.fromisoformat(created_at), ObjectId(_id)
+    except InvalidId as e:
+        raise ValueError(f"Invalid cursor: {e}") from e
+
+
+def iter_torrents(query: dict, cursor: str | None = None, limit: int | None = None):
+    """Yield torrents oldest first, one page at a time (keyset pagination)"""
+    last = decode_cursor(cursor) if cursor else None
+    sent = 0
+    
+    while limit is None or sent < limit:
+        page_query = dict(query)
+        if last:
+            page_query = {'$and': [query, {'$or': [
+                {'created_at': {'$gt': last[0]}},
+                {'created_at': last[0], '_id': {'$gt': last[1]}},
+            ]}]}
+        
+        batch = EXPORT_BATCH_SIZE if limit is None else min(EXPORT_BATCH_SIZE, limit - sent)
+        page = list(
+            torrents_collection.find(page_query)
+            .sort([("created_at", 1), ("_id", 1)])
+            .limit(batch)
+        )
+        if not page:
+            return
+        
+        for doc in page:
+            yield doc
+        sent += len(page)
+        last = (page[-1]['created_at'], page[-1]['_id'])
+        
+        if len(page) < batch:
+            return
+
+
+def export_record(doc: dict) -> dict:
+    """JSON-safe torrent record"""
+    record = {k: v for k, v in doc.items() if k != '_id'}
+    record['created_at'] = doc['created_at'].isoformat()
+    record['cursor'] = encode_cursor(doc)
+    return record
+
+
+def iter_ndjson(query: dict, cursor: str | None = None, limit: int | None = None):
+    """Yield torrents as NDJSON lines"""
+    for doc in iter_torrents(query, cursor, limit):
+        yield (json.dumps(export_record(doc), default=str) + "\n").encode()
+
+
+def iter_torrent_zip(query: dict, cursor: str | None = None, limit: int | None = None):
+    """Yield a zip of the .torrent files, one chunk per entry"""
+    stream = ZipChunkWriter()
+    with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as zf:
+        for doc in iter_torrents(query, cursor, limit):
+            torrent_file = Path(doc['torrent_file'])
+            if not torrent_file.exists():
+                continue
+            zf.write(torrent_file, arcname=f"{doc['info_hash'][:8]}_{torrent_file.name}")
+            yield stream.drain()
+    yield stream.drain()
+
+
+def write_export(path: Path, fmt: str, query: dict) -> int:
+    """Stream an export to disk, returns bytes written"""
+    chunks = iter_torrent_zip(query) if fmt == "zip" else iter_ndjson(query)
+    written = 0
+    with open(path, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+            written += len(chunk)
+    return written
+
+
+def parse_export_args(args: list[str]) -> tuple[str, dict]:
+    """Parse `ndjson|zip user:<id> from:<date> to:<date> min:<MB> max:<MB>`"""
+    fmt = "ndjson"
+    filters_ = {}
+    for arg in args:
+        key, _, value = arg.partition(":")
+        if key in ("ndjson", "zip") and not value:
+            fmt = key
+        elif key == "user":
+            filters_['user_id'] = int(value)
+        elif key == "from":
+            filters_['since'] = datetime.fromisoformat(value)
+        elif key == "to":
+            filters_['until'] = datetime.fromisoformat(value)
+        elif key == "min":
+            filters_['min_size'] = int(float(value) * 1024**2)
+        elif key == "max":
+            filters_['max_size'] = int(float(value) * 1024**2)
+        else:
+            raise ValueError(f"Unknown option: {arg}")
+    return fmt, filters_
+
+
+async def next_chunks(chunks, count: int = 64) -> list[bytes]:
+    """Pull up to `count` chunks from a blocking generator off the event loop"""
+    def pull():
+        out = []
+        for chunk in chunks:
+            out.append(chunk)
+            if len(out) >= count:
+                break
+        return out
+    return await asyncio.get_event_loop().run_in_executor(None, pull)
+
+
+async def handle_export_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """GET /export?format=ndjson|zip&user=&from=&to=&min_bytes=&max_bytes=&cursor=&limit="""
+    chunks = None
+    try:
+        request_line = (await reader.readline()).decode(errors="replace").split()
+        # Drain headers
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        
+        if len(request_line) < 2 or request_line[0] != "GET":
+            writer.write(b"HTTP/1.1 405 Method Not Allowed\r\nContent-Length: 0\r\n\r\n")
+            return
+        
+        url = urlsplit(request_line[1])
+        if url.path != "/export":
+            writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+            return
+        
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        try:
+            fmt = params.get("format", "ndjson")
+            query = build_export_query(
+                user_id=int(params["user"]) if "user" in params else None,
+                since=datetime.fromisoformat(params["from"]) if "from" in params else None,
+                until=datetime.fromisoformat(params["to"]) if "to" in params else None,
+                min_size=int(params["min_bytes"]) if "min_bytes" in params else None,
+                max_size=int(params["max_bytes"]) if "max_bytes" in params else None,
+            )
+            cursor = params.get("cursor")
+            limit = int(params["limit"]) if "limit" in params else None
+            if limit is not None and limit <= 0:
+                raise ValueError("limit must be positive")
+            if cursor:
+                decode_cursor(cursor)
+            if fmt not in ("ndjson", "zip"):
+                raise ValueError(f"Unknown format: {fmt}")
+        except (KeyError, ValueError) as e:
+            body = f"Bad request: {e}".encode()
+            writer.write(
+                b"HTTP/1.1 400 Bad Request\r\nContent-Type: text/plain\r\n"
+                + f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+            )
+            return
+        
+        if fmt == "zip":
+            chunks = iter_torrent_zip(query, cursor, limit)
+            content_type = "application/zip"
+        else:
+            chunks = iter_ndjson(query, cursor, limit)
+            content_type = "application/x-ndjson"
+        
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            + f"Content-Type: {content_type}\r\n".encode()
+            + b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n"
+        )
+        while True:
+            batch = await next_chunks(chunks)
+            if not batch:
+                break
+            data = b"".join(batch)
+            if data:
+                writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        
+    except Exception as e:
+        logger.error(f"Export request error: {e}", exc_info=True)
+    finally:
+        # Finish the generator (and its zip) even if the client went away mid-stream
+        if chunks is not None:
+            try:
+                await asyncio.get_event_loop().run_in_executor(None, chunks.close)
+            except ValueError:
+                pass  # Still running in an executor thread after a cancel
+        try:
+            await writer.drain()
+            writer.close()
+        except Exception:
+            pass
+
+
+async def export_server():
+    """Serve the local bulk export endpoint"""
+    if EXPORT_PORT == 0:
+        return
+    server = await asyncio.start_server(handle_export_request, EXPORT_HOST, EXPORT_PORT)
+    logger.info(f"📤 Export endpoint on http://{EXPORT_HOST}:{EXPORT_PORT}/export")
+    async with server:
+        await server.serve_forever()
+
+# --- Background Scrubber ---
+
+# 'seconds' is wall time spent scrubbing (including throttle and idle waits),
+# 'read_seconds' only the time spent reading and hashing
+scrub_stats = {
+    'torrents': 0, 'pieces': 0, 'bytes': 0, 'seconds': 0.0, 'read_seconds': 0.0,
+    'corrupt': 0, 'refetched': 0, 'current': None,
+}
+
+
+def verify_pieces(file_path: Path, info: lt.torrent_info, start: int, count: int) -> list[int]:
+    """SHA-1 check pieces [start, start + count) of a single-file torrent, returns bad pieces"""
+    bad = []
+    piece_length = info.piece_length()
+    end = min(start + count, info.num_pieces())
+    with open(file_path, "rb") as f:
+        f.seek(start * piece_length)
+        for piece in range(start, end):
+            data = f.read(info.piece_size(piece))
+            if hashlib.sha1(data).digest() != bytes(info.hash_for_piece(piece)):
+                bad.append(piece)
+    return bad
+
+
+def pipeline_busy() -> bool:
+    """Uploads are downloading or hashing, so the disk is not idle"""
+    return any(memory_reserved.values())
+
+
+def load_verified_at(info_hashes: list[str]) -> dict:
+    """Last verification time per info_hash from MongoDB"""
+    cursor = torrents_collection.find(
+        {'info_hash': {'$in': info_hashes}},
+        {'info_hash': 1, 'verified_at': 1}
+    )
+    return {doc['info_hash']: doc.get('verified_at') for doc in cursor}
+
+
+def mark_scrubbed(info_hash: str, status: str, **fields):
+    """Record a scrub result on the torrent's MongoDB record"""
+    try:
+        torrents_collection.update_one(
+            {'info_hash': info_hash},
+            {'$set': {'scrub_status': status, **fields}}
+        )
+    except Exception as e:
+        logger.error(f"MongoDB scrub update error: {e}")
+
+
+async def next_scrub_target() -> str | None:
+    """Active torrent that was never verified, or verified longest ago"""
+    if not active_torrents:
+        return None
+    verified = await asyncio.get_event_loop().run_in_executor(
+        None, load_verified_at, list(active_torrents)
+    )
+    
+    cutoff = datetime.utcnow().timestamp() - SCRUB_INTERVAL_HOURS * 3600
+    due = [
+        (verified.get(h).timestamp() if verified.get(h) else 0.0, h)
+        for h in active_torrents
+    ]
+    due = [item for item in due if item[0] < cutoff]
+    return min(due)[1] if due else None
+
+
+async def scrub_torrent(info_hash: str):
+    """Re-verify every piece of a seeded payload within the I/O budget"""
+    data = active_torrents[info_hash]
+    metadata = get_torrent_metadata(info_hash, data['torrent_file'])
+    if metadata is None or metadata['info'].num_files() != 1:
+        await asyncio.get_event_loop().run_in_executor(
+            None, lambda: mark_scrubbed(info_hash, 'skipped', verified_at=datetime.utcnow())
+        )
+        return
+    
+    info = metadata['info']
+    file_path = data['file_path']
+    loop = asyncio.get_event_loop()
+    
+    if not file_path.exists() or file_path.stat().st_size != info.total_size():
+        await quarantine_and_refetch(info_hash, "payload missing or truncated")
+        return
+    
+    # Pieces per one-second slot of the I/O budget
+    batch = max(1, SCRUB_RATE_MB * 1024 * 1024 // info.piece_length())
+    scrub_stats['current'] = data['name']
+    piece = 0
+    
+    while piece < info.num_pieces():
+        slot_start = time.monotonic()
+        
+        # Only use the disk while no upload is downloading or hashing
+        while pipeline_busy():
+            await asyncio.sleep(5)
+        if info_hash not in active_torrents:
+            scrub_stats['current'] = None
+            scrub_stats['seconds'] += time.monotonic() - slot_start
+            return
+        
+        read_start = time.monotonic()
+        bad = await loop.run_in_executor(None, verify_pieces, file_path, info, piece, batch)
+        read_time = time.monotonic() - read_start
+        
+        checked = min(batch, info.num_pieces() - piece)
+        scrub_stats['pieces'] += checked
+        scrub_stats['bytes'] += sum(info.piece_size(p) for p in range(piece, piece + checked))
+        scrub_stats['read_seconds'] += read_time
+        
+        if bad:
+            scrub_stats['seconds'] += time.monotonic() - slot_start
+            await quarantine_and_refetch(info_hash, f"{len(bad)} bad pieces from #{bad[0]}")
+            return
+        
+        piece += batch
+        await asyncio.sleep(max(0.0, 1.0 - read_time))
+        scrub_stats['seconds'] += time.monotonic() - slot_start
+    
+    scrub_stats['torrents'] += 1
+    scrub_stats['current'] = None
+    await loop.run_in_executor(
+        None, lambda: mark_scrubbed(info_hash, 'ok', verified_at=datetime.utcnow())
+    )
+    logger.info(f"🧽 Scrubbed OK: {data['name']} | Hash: {info_hash[:16]}")
+
+
+async def quarantine_and_refetch(info_hash: str, reason: str):
+    """Stop seeding a corrupted payload, move it aside and re-download it from BIN_CHANNEL"""
+    data = active_torrents.pop(info_hash)
+    file_path = data['file_path']
+    loop = asyncio.get_event_loop()
+    scrub_stats['corrupt'] += 1
+    scrub_stats['current'] = None
+    logger.error(f"☣️ Corrupted payload: {data['name']} | {reason}")
+    
+    if data['handle'].is_valid():
+        lt_session.remove_torrent(data['handle'])
+    
+    # Leave the file alone if another torrent seeds it (e.g. an older same-name upload)
+    quarantine_path = QUARANTINE_DIR / f"{info_hash[:16]}_{file_path.name}"
+    shared = any(other['file_path'] == file_path for other in active_torrents.values())
+    if shared:
+        logger.warning(f"⚠️ {file_path} is seeded by another torrent, not quarantining it")
+    elif file_path.exists():
+        file_path.replace(quarantine_path)
+        await loop.run_in_executor(
+            None, lambda: mark_scrubbed(info_hash, 'quarantined', file_path=str(quarantine_path))
+        )
+    
+    record = await loop.run_in_executor(
+        None, torrents_collection.find_one, {'info_hash': info_hash}
+    )
+    msg_id = record.get('bin_channel_msg_id') if record else None
+    if not msg_id:
+        await loop.run_in_executor(
+            None, lambda: mark_scrubbed(info_hash, 'quarantined', quarantined_at=datetime.utcnow())
+        )
+        logger.warning(f"⚠️ No bin channel copy for {data['name']}, not re-fetched")
+        return
+    
+    # Re-fetch into a per-torrent directory so same-name uploads can't clobber it again
+    refetch_path = SEED_DIR / info_hash / data['name']
+    refetch_path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        stored = await tg_send(BIN_CHANNEL, app.get_messages, BIN_CHANNEL, msg_id)
+        info = get_torrent_metadata(info_hash, data['torrent_file'])['info']
+        async with memory_reservation('download', min(info.total_size(), DOWNLOAD_JOB_MB * 1024 * 1024)):
+            await stored.download(file_name=str(refetch_path))
+        
+        bad = await loop.run_in_executor(
+            None, verify_pieces, refetch_path, info, 0, info.num_pieces()
+        )
+        if bad:
+            raise ValueError(f"{len(bad)} bad pieces in bin channel copy")
+        
+        start_seeding(refetch_path, data['torrent_file'], info_hash)
+        scrub_stats['refetched'] += 1
+        await loop.run_in_executor(
+            None, lambda: mark_scrubbed(
+                info_hash, 'refetched', file_path=str(refetch_path),
+                verified_at=datetime.utcnow(), quarantined_at=datetime.utcnow()
+            )
+        )
+        logger.info(f"♻️ Re-fetched from BIN_CHANNEL: {data['name']}")
+    except Exception as e:
+        logger.error(f"Re-fetch failed for {data['name']}: {e}")
+        await loop.run_in_executor(
+            None, lambda: mark_scrubbed(info_hash, 'quarantined', quarantined_at=datetime.utcnow())
+        )
+
+
+async def scrub_loop():
+    """Continuously re-verify seeded payloads, oldest verification first."""
+    if SCRUB_RATE_MB == 0:
+        return
+    logger.info(f"Scrub loop started: {SCRUB_RATE_MB} MB/s, every {SCRUB_INTERVAL_HOURS}h per torrent")
+    while True:
+        try:
+            info_hash = await next_scrub_target()
+            if info_hash is None:
+                await asyncio.sleep(60)
+                continue
+            await scrub_torrent(info_hash)
+        except Exception as e:
+            logger.error(f"Scrub error: {e}", exc_info=True)
+            await asyncio.sleep(60)
+
 # --- Pyrogram Handlers ---
 
 @app.on_message(filters.document | filters.video | filters.audio)
@@ -303,11 +1203,12 @@ async def handle_file(client: Client, message: Message):
         
         # Size check (4GB limit)
         if file_size > 4 * 1024 * 1024 * 1024:
-            await message.reply_text("❌ File exceeds 4GB limit!")
+            await tg_send(message.chat.id, message.reply_text, "❌ File exceeds 4GB limit!")
             return
         
         # Quick status
-        status = await message.reply_text(
+        status = await tg_send(
+            message.chat.id, message.reply_text,
             f"⚡ **Processing...**\n\n"
             f"📄 `{file_name}`\n"
             f"📦 **{file_size_mb:.1f} MB**"
@@ -318,21 +1219,24 @@ async def handle_file(client: Client, message: Message):
         try:
             # Try sending file directly to channel
             if message.document:
-                forwarded = await client.send_document(
+                forwarded = await tg_send(
+                    BIN_CHANNEL, client.send_document,
                     BIN_CHANNEL,
                     message.document.file_id,
                     caption=f"📁 {file_name}\n👤 From: {message.from_user.id}"
                 )
                 forwarded_id = forwarded.id
             elif message.video:
-                forwarded = await client.send_video(
+                forwarded = await tg_send(
+                    BIN_CHANNEL, client.send_video,
                     BIN_CHANNEL,
                     message.video.file_id,
                     caption=f"🎬 {file_name}\n👤 From: {message.from_user.id}"
                 )
                 forwarded_id = forwarded.id
             elif message.audio:
-                forwarded = await client.send_audio(
+                forwarded = await tg_send(
+                    BIN_CHANNEL, client.send_audio,
                     BIN_CHANNEL,
                     message.audio.file_id,
                     caption=f"🎵 {file_name}\n👤 From: {message.from_user.id}"
@@ -344,8 +1248,9 @@ async def handle_file(client: Client, message: Message):
             logger.warning(f"⚠️ Channel forward skipped: {e}")
             
         
-        # STEP 2: Download locally 
-        file_path = SEED_DIR / file_name
+        # STEP 2: Download locally (one directory per upload, so same-name files don't collide)
+        file_path = SEED_DIR / media.file_unique_id / file_name
+        file_path.parent.mkdir(parents=True, exist_ok=True)
         download_start = time.time()
         
         async def progress(current, total):
@@ -353,15 +1258,17 @@ async def handle_file(client: Client, message: Message):
             pass 
         
         try:
-            await message.download(file_name=str(file_path), progress=progress)
+            async with memory_reservation('download', min(file_size, DOWNLOAD_JOB_MB * 1024 * 1024)):
+                await message.download(file_name=str(file_path), progress=progress)
             download_time = time.time() - download_start
             logger.info(f"✅ Downloaded in {download_time:.1f}s")
         except Exception as e:
-            await status.edit_text(f"❌ Download failed: {e}")
+            await tg_send(message.chat.id, status.edit_text, f"❌ Download failed: {e}")
             return
         
         # STEP 3: Create torrent (async)
-        await status.edit_text(
+        await tg_send(
+            message.chat.id, status.edit_text,
             f"⚡ **Processing...**\n\n"
             f"📄 `{file_name}`\n"
             f"📦 **{file_size_mb:.1f} MB**\n\n"
@@ -369,18 +1276,19 @@ async def handle_file(client: Client, message: Message):
         )
         
         try:
-            torrent_file, magnet_link = await asyncio.get_event_loop().run_in_executor(
-                None, create_torrent_file, file_path
-            )
+            async with memory_reservation('hash', min(file_size, HASH_JOB_MB * 1024 * 1024)):
+                torrent_file, magnet_link, info_hash = await asyncio.get_event_loop().run_in_executor(
+                    None, create_torrent_file, file_path
+                )
         except Exception as e:
-            await status.edit_text(f"❌ Torrent creation failed: {e}")
+            await tg_send(message.chat.id, status.edit_text, f"❌ Torrent creation failed: {e}")
             return
         
         # STEP 4: Start seeding
         try:
-            info_hash = start_seeding(file_path, torrent_file)
+            info_hash = start_seeding(file_path, torrent_file, info_hash)
         except Exception as e:
-            await status.edit_text(f"❌ Seeding failed: {e}")
+            await tg_send(message.chat.id, status.edit_text, f"❌ Seeding failed: {e}")
             return
         
         # Calculate total time
@@ -398,7 +1306,9 @@ async def handle_file(client: Client, message: Message):
             'user_id': message.from_user.id,
             'username': message.from_user.username,
             'processing_time': total_time,
-            'channel_forwarded': forwarded_id is not None
+            'channel_forwarded': forwarded_id is not None,
+            'file_path': str(file_path),
+            'verified_at': datetime.utcnow()  # Just hashed, so the scrubber can wait a full interval
         }
         
         await asyncio.get_event_loop().run_in_executor(
@@ -406,7 +1316,7 @@ async def handle_file(client: Client, message: Message):
         )
         
         # Send final result
-        await status.delete()
+        await tg_send(message.chat.id, status.delete)
         
         # 1. Create the main caption
         caption = (
@@ -418,27 +1328,34 @@ async def handle_file(client: Client, message: Message):
             f"🚀 **SEEDING AT 1000MB/s** 🚀"
         )
         
-        # 2. Send the .torrent file
-        torrent_message = await message.reply_document(
+        magnet_text = f"🧲 **Magnet:**\n`{magnet_link}`"
+        merged_caption = f"{caption}\n\n{magnet_text}"
+        magnet_in_caption = len(merged_caption) <= CAPTION_LIMIT
+        
+        # 2. Send the .torrent file (with the magnet when it fits in the caption)
+        torrent_message = await tg_send(
+            message.chat.id, message.reply_document,
             document=str(torrent_file),
-            caption=caption,
+            caption=merged_caption if magnet_in_caption else caption,
             file_name=torrent_file.name
         )
         
-        # 3. Send the magnet link as a separate message
-        await client.send_message(
-            chat_id=message.chat.id,
-            text=f"🧲 **Magnet:**\n`{magnet_link}`",
-            reply_to_message_id=torrent_message.id,
-            disable_web_page_preview=True
-        )
+        # 3. Otherwise send the magnet link as a separate message
+        if not magnet_in_caption:
+            await tg_send(
+                message.chat.id, client.send_message,
+                chat_id=message.chat.id,
+                text=magnet_text,
+                reply_to_message_id=torrent_message.id,
+                disable_web_page_preview=True
+            )
         
         logger.info(f"✅ Complete in {total_time:.1f}s: {file_name}")
         
     except Exception as e:
         logger.error(f"Critical error: {e}", exc_info=True)
         try:
-            await message.reply_text(f"❌ Critical Error: {e}")
+            await tg_send(message.chat.id, message.reply_text, f"❌ Critical Error: {e}")
         except:
             pass
 
@@ -447,7 +1364,7 @@ async def handle_file(client: Client, message: Message):
 async def stats_command(client: Client, message: Message):
     """Show seeding stats"""
     if not active_torrents:
-        await message.reply_text("📊 **No active torrents**")
+        await tg_send(message.chat.id, message.reply_text, "📊 **No active torrents**")
         return
     
     stats = "📊 **Active Torrents**\n\n"
@@ -464,16 +1381,27 @@ async def stats_command(client: Client, message: Message):
         upload_gb = status.total_upload / (1024**3)
         total_upload += upload_gb
         
+        metadata = get_torrent_metadata(info_hash, data['torrent_file'])
+        pieces = ""
+        if metadata:
+            info = metadata['info']
+            pieces = f"🧩 {info.num_pieces()} x {info.piece_length() // 1024}KB\n"
+        
         stats += (
             f"📄 **{data['name'][:30]}**\n"
             f"🔑 `{info_hash[:20]}...`\n"
+            f"{pieces}"
             f"⬆️ {upload_gb:.2f} GB\n"
             f"🌱 Seeds: {status.num_seeds} | Peers: {status.num_peers}\n"
             f"⏱ {hours}h {minutes}m\n\n"
         )
     
-    stats += f"📊 **Total Upload:** {total_upload:.2f} GB"
-    await message.reply_text(stats)
+    stats += f"📊 **Total Upload:** {total_upload:.2f} GB\n"
+    stats += (
+        f"🗂 **Metadata Cache:** {len(torrent_info_cache)} entries | "
+        f"{torrent_cache_stats['hits']} hits | {torrent_cache_stats['misses']} misses"
+    )
+    await tg_send(message.chat.id, message.reply_text, stats)
 
 
 @app.on_message(filters.command("list"))
@@ -483,7 +1411,7 @@ async def list_command(client: Client, message: Message):
         torrents = list(torrents_collection.find().sort("created_at", -1).limit(10))
         
         if not torrents:
-            await message.reply_text("📂 **No torrents in database**")
+            await tg_send(message.chat.id, message.reply_text, "📂 **No torrents in database**")
             return
         
         text = "📂 **Recent Torrents**\n\n"
@@ -496,15 +1424,110 @@ async def list_command(client: Client, message: Message):
                 f"🔑 `{t['info_hash'][:20]}...`\n\n"
             )
         
-        await message.reply_text(text)
+        await tg_send(message.chat.id, message.reply_text, text)
+    except Exception as e:
+        await tg_send(message.chat.id, message.reply_text, f"❌ Error: {e}")
+
+
+@app.on_message(filters.command("mem"))
+async def mem_command(client: Client, message: Message):
+    """Show memory budget and per-stage reservations"""
+    report = memory_report()
+    limits = report['limits_mb']
+    reserved = report['reserved_mb']
+    
+    text = (
+        f"🧠 **Memory Budget**\n\n"
+        f"📦 Budget: **{report['budget_mb']} MB** (x{report['factor']})\n"
+        f"🌡 Pressure: {report['pressure']:.1f}%\n"
+        f"📈 RSS: {report['rss_mb']} MB | Peak: {report['peak_rss_mb']} MB\n"
+        f"💾 libtorrent: {limits['libtorrent']} MB\n"
+        f"🔧 Hash: {reserved['hash']}/{limits['hash']} MB\n"
+        f"📥 Download: {reserved['download']}/{limits['download']} MB\n\n"
+    )
+    for stage, data in report['stages'].items():
+        text += (
+            f"**{stage}** — {data['active']} active, {data['jobs']} done\n"
+            f"Reserved: {data['reserved_mb']} MB | Peak reserved: {data['peak_reserved_mb']} MB\n"
+            f"Process RSS peak while active: {data['process_rss_peak_mb']} MB\n"
+        )
+    await tg_send(message.chat.id, message.reply_text, text)
+
+
+@app.on_message(filters.command("export"))
+async def export_command(client: Client, message: Message):
+    """Bulk export torrents as NDJSON or a zip of .torrent files"""
+    try:
+        fmt, export_filters = parse_export_args(message.command[1:])
+    except ValueError as e:
+        await tg_send(
+            message.chat.id, message.reply_text,
+            f"❌ {e}\n\n"
+            "Usage: `/export [ndjson|zip] [user:<id>] [from:YYYY-MM-DD] [to:YYYY-MM-DD] [min:MB] [max:MB]`"
+        )
+        return
+    
+    # Only the owner can export other users' torrents
+    if message.from_user.id != OWNER_ID:
+        export_filters['user_id'] = message.from_user.id
+    
+    status = await tg_send(message.chat.id, message.reply_text, "📤 **Exporting...**")
+    export_path = EXPORT_DIR / f"export_{message.from_user.id}_{int(time.time())}.{fmt}"
+    try:
+        size = await asyncio.get_event_loop().run_in_executor(
+            None, write_export, export_path, fmt, build_export_query(**export_filters)
+        )
+        await tg_send(
+            message.chat.id, message.reply_document,
+            document=str(export_path),
+            caption=f"📤 **Export** ({size / 1024**2:.1f} MB)"
+        )
+        await tg_send(message.chat.id, status.delete)
     except Exception as e:
-        await message.reply_text(f"❌ Error: {e}")
+        await tg_send(message.chat.id, status.edit_text, f"❌ Export failed: {e}")
+    finally:
+        export_path.unlink(missing_ok=True)
+
+
+@app.on_message(filters.command("queue"))
+async def queue_command(client: Client, message: Message):
+    """Show outbound Telegram queue and FloodWait stats"""
+    report = send_queue_report()
+    await tg_send(
+        message.chat.id, message.reply_text,
+        f"📬 **Send Queue**\n\n"
+        f"📥 Queued: **{report['queued']}** (max {report['max_queued']})\n"
+        f"💬 Chats waiting: {report['chats_waiting']}\n"
+        f"📤 Sent: {report['sent']}\n"
+        f"⏳ FloodWaits: {report['flood_waits']} ({report['flood_wait_seconds']}s)\n"
+        f"🚦 Chats in FloodWait: {report['chats_in_flood_wait']}\n"
+        f"🪣 Global tokens: {report['global_tokens']}"
+    )
+
+
+@app.on_message(filters.command("scrub"))
+async def scrub_command(client: Client, message: Message):
+    """Show background scrubber progress and throughput"""
+    mb = scrub_stats['bytes'] / (1024**2)
+    throughput = mb / scrub_stats['seconds'] if scrub_stats['seconds'] else 0.0
+    read_speed = mb / scrub_stats['read_seconds'] if scrub_stats['read_seconds'] else 0.0
+    await tg_send(
+        message.chat.id, message.reply_text,
+        f"🧽 **Scrubber**\n\n"
+        f"📄 Current: `{scrub_stats['current'] or 'idle'}`\n"
+        f"✅ Torrents verified: {scrub_stats['torrents']}\n"
+        f"🧩 Pieces: {scrub_stats['pieces']} ({scrub_stats['bytes'] / 1024**3:.2f} GB)\n"
+        f"⚡ Scrub throughput: {throughput:.1f} MB/s (budget {SCRUB_RATE_MB} MB/s)\n"
+        f"💽 Disk read speed: {read_speed:.1f} MB/s\n"
+        f"☣️ Corrupt: {scrub_stats['corrupt']} | ♻️ Re-fetched: {scrub_stats['refetched']}"
+    )
 
 
 @app.on_message(filters.command("start"))
 async def start_command(client: Client, message: Message):
     """Welcome message"""
-    await message.reply_text(
+    await tg_send(
+        message.chat.id, message.reply_text,
         "🤖 **Telegram Torrent Bot**\n\n"
         "Send me any file up to **4GB**!\n\n"
         "**Features:**\n"
@@ -516,6 +1539,10 @@ async def start_command(client: Client, message: Message):
         "**Commands:**\n"
         "/stats - Active torrents\n"
         "/list - Recent torrents\n"
+        "/export - Bulk export (NDJSON or zip)\n"
+        "/mem - Memory budget\n"
+        "/queue - Send queue\n"
+        "/scrub - Payload verification\n"
         "/start - This message"
     )
 
@@ -528,13 +1555,14 @@ async def db_stats(client: Client, message: Message):
         total_size = sum([t['file_size'] for t in torrents_collection.find()])
         total_gb = total_size / (1024**3)
         
-        await message.reply_text(
+        await tg_send(
+            message.chat.id, message.reply_text,
             f"💾 **Database Stats**\n\n"
             f"📊 Total Torrents: **{total}**\n"
             f"📦 Total Size: **{total_gb:.2f} GB**"
         )
     except Exception as e:
-        await message.reply_text(f"❌ Error: {e}")
+        await tg_send(message.chat.id, message.reply_text, f"❌ Error: {e}")
 
 # --- New Main Asynchronous Execution Function ---
 async def main():
@@ -558,11 +1586,13 @@ async def main():
 
         # Notify the owner that the bot has started (Ensures the client is ready)
         if OWNER_ID != 0:
-            await app.send_message(OWNER_ID, "✅ Bot deployed and monitor started! **Running with full async fix.**")
+            await tg_send(OWNER_ID, app.send_message, OWNER_ID, "✅ Bot deployed and monitor started! **Running with full async fix.**")
 
         # Run the monitor loop and the main Pyrogram listener concurrently
         await asyncio.gather(
             lt_monitor_loop(),
+            export_server(),
+            scrub_loop(),
             app.idle()
         )
 